@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Load testing of API endpoints.
+"""
+
+import os
+import csv
+import time
+import random
+import shutil
+import httplib
+import urllib2
+import tempfile
+import threading
+import multiprocessing
+from Queue import Queue, Empty
+from datetime import date, timedelta
+
+from presence_analyzer.main import app
+from presence_analyzer.utils import date_range, percentile, warm_up
+
+import logging
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+ENDPOINTS = {
+    'users': '/api/v1/users',
+    'mean_time_weekday': '/api/v1/mean_time_weekday/{0}',
+    'presence_weekday': '/api/v1/presence_weekday/{0}',
+}
+DEFAULT_MIX = 'users:1,mean_time_weekday:2,presence_weekday:2'
+DEFAULT_OPTIONS = {
+    'requests': 2000,
+    'concurrency': 10,
+    'mix': DEFAULT_MIX,
+    'users': 50,
+    'days': 180,
+    'workers': 50,
+    'spawn_if_under': 5,
+    'max_requests': 200,
+    'timeout': 30,
+}
+STARTUP_TIMEOUT = 120
+
+
+def format_seconds(seconds):
+    """
+    Formats amount of seconds since midnight as HH:MM:SS.
+    """
+    return '{0:02d}:{1:02d}:{2:02d}'.format(
+        seconds // 3600, seconds // 60 % 60, seconds % 60
+    )
+
+
+def generate_data(path, users, days):
+    """
+    Writes random presence entries of working days to CSV file.
+    """
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    with open(path, 'wb') as csvfile:
+        writer = csv.writer(csvfile)
+        for user_id in range(1, users + 1):
+            for day in date_range(start, end):
+                if day.weekday() >= 5:
+                    continue
+                begin = random.randint(7 * 3600, 10 * 3600)
+                finish = begin + random.randint(4 * 3600, 9 * 3600)
+                writer.writerow([
+                    user_id,
+                    day.isoformat(),
+                    format_seconds(begin),
+                    format_seconds(finish),
+                ])
+
+
+def parse_mix(mix):
+    """
+    Parses 'endpoint:weight' pairs separated by commas into list of
+    endpoint names, every name repeated according to its weight.
+    """
+    result = []
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition(':')
+        if name not in ENDPOINTS:
+            raise ValueError('Unknown endpoint: {0}'.format(name))
+        weight = weight or '1'
+        if not weight.isdigit() or int(weight) < 1:
+            raise ValueError(
+                'Weight of {0} must be a positive integer: {1}'.format(
+                    name, weight
+                )
+            )
+        result += [name] * int(weight)
+    return result
+
+
+def serve(data_csv, options, ports):
+    """
+    Serves application on given data file, puts chosen port to 'ports'
+    queue once it is ready. Runs in a separate process.
+    """
+    from paste import httpserver
+    app.config.update({'DATA_CSV': data_csv})
+    warm_up(options['users'])
+    server = httpserver.serve(
+        app,
+        host='127.0.0.1',
+        port=0,
+        start_loop=False,
+        use_threadpool=True,
+        threadpool_workers=options['workers'],
+        threadpool_options={
+            'spawn_if_under': options['spawn_if_under'],
+            'max_requests': options['max_requests'],
+        },
+    )
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server(data_csv, options):
+    """
+    Starts server process and returns it together with its base url.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve, args=(data_csv, options, ports)
+    )
+    process.daemon = True
+    process.start()
+    try:
+        port = ports.get(timeout=STARTUP_TIMEOUT)
+    except Empty:
+        process.terminate()
+        raise RuntimeError('Server did not start in time')
+    return process, 'http://127.0.0.1:{0}'.format(port)
+
+
+def fetch(url, timeout, latencies, errors):
+    """
+    Requests given url and records its latency or failure.
+    """
+    started = time.time()
+    try:
+        urllib2.urlopen(url, timeout=timeout).read()
+    # socket.timeout is an IOError
+    except (urllib2.URLError, httplib.HTTPException, IOError):
+        log.debug('Request to %s failed', url, exc_info=True)
+        errors.append(url)
+    else:
+        latencies.append(time.time() - started)
+
+
+def worker(queue, timeout, latencies, errors):
+    """
+    Requests urls from queue until it is empty.
+    """
+    while True:
+        try:
+            url = queue.get_nowait()
+        except Empty:
+            return
+        fetch(url, timeout, latencies, errors)
+
+
+def drive(urls, concurrency, timeout):
+    """
+    Requests all urls using given number of concurrent clients, requests
+    taking longer than 'timeout' seconds are counted as errors.
+
+    Returns latencies of successful requests, failed urls and duration.
+    """
+    queue = Queue()
+    for url in urls:
+        queue.put(url)
+
+    latencies = []
+    errors = []
+    clients = [
+        threading.Thread(
+            target=worker, args=(queue, timeout, latencies, errors)
+        )
+        for _ in range(concurrency)
+    ]
+    started = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return latencies, errors, time.time() - started
+
+
+def run_load_test(**options):
+    """
+    Serves application on generated data in a separate process and drives
+    it with a fixed number of concurrent clients. Accepts DEFAULT_OPTIONS.
+
+    Returns dictionary with number of requests, errors, requests per second
+    and latency percentiles in milliseconds.
+    """
+    unknown = set(options) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise TypeError('Unknown options: {0}'.format(', '.join(unknown)))
+    options = dict(DEFAULT_OPTIONS, **options)
+    endpoints = parse_mix(options['mix'])
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        data_csv = os.path.join(tmpdir, 'loadtest_data.csv')
+        generate_data(data_csv, options['users'], options['days'])
+        process, base_url = start_server(data_csv, options)
+        try:
+            latencies, errors, duration = drive(
+                [
+                    base_url + ENDPOINTS[random.choice(endpoints)].format(
+                        random.randint(1, options['users'])
+                    )
+                    for _ in range(options['requests'])
+                ],
+                options['concurrency'],
+                options['timeout'],
+            )
+        finally:
+            process.terminate()
+            process.join()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return {
+        'requests': len(latencies) + len(errors),
+        'errors': len(errors),
+        'duration': duration,
+        'rps': len(latencies) / duration if duration else 0,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+    }
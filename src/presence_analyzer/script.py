@@ -4,6 +4,7 @@
 
 import os
 import sys
+import logging
 from functools import partial
 
 import paste.script.command
@@ -24,12 +25,20 @@ for i in range(2 + __name__.count('.')):
 abspath = partial(os.path.join, _buildout_path)
 del _buildout_path
 
+log = logging.getLogger(__name__)
+
 
 # bin/paster serve parts/etc/deploy.ini
-def make_app(global_conf={}, config=DEPLOY_CFG, debug=False):
-    from presence_analyzer import app
+def make_app(global_conf={}, config=DEPLOY_CFG, debug=False, warm_up=True):
+    from presence_analyzer import app, utils
     app.config.from_pyfile(abspath(config))
     app.debug = debug
+    if warm_up and app.config.get('WARM_UP'):
+        try:
+            utils.warm_up(app.config.get('WARM_UP_USERS', 10))
+        except (IOError, OSError):
+            # readiness check reports the problem and retries loading
+            log.exception('Warming up failed!')
     return app
 
 
@@ -44,7 +53,7 @@ def make_debug(global_conf={}, **conf):
 def make_shell():
     """Interactive Flask Shell"""
     from flask import request
-    app = make_app()
+    app = make_app(warm_up=False)
     http = app.test_client()
     reqctx = app.test_request_context
     return locals()
@@ -110,4 +119,49 @@ def run():
         """Stop the application."""
         _serve('stop', dry_run=dry_run)
 
+    # bin/flask-ctl loadtest
+    from presence_analyzer.loadtest import DEFAULT_OPTIONS, run_load_test
+    defaults = DEFAULT_OPTIONS
+
+    def action_loadtest(requests=('n', defaults['requests']),
+                        concurrency=('c', defaults['concurrency']),
+                        mix=('m', defaults['mix']),
+                        users=defaults['users'],
+                        days=defaults['days'],
+                        workers=defaults['workers'],
+                        spawn_if_under=defaults['spawn_if_under'],
+                        max_requests=defaults['max_requests'],
+                        timeout=defaults['timeout']):
+        """Load test the API on generated data.
+
+        Serves the application with paste threadpool settings in a separate
+        process and sends requests to a weighted mix of API endpoints.
+
+        Options:
+         - '--requests' total number of requests
+         - '--concurrency' number of simultaneous clients
+         - '--mix' comma separated 'endpoint:weight' pairs, endpoint is
+           one of [users|mean_time_weekday|presence_weekday]
+         - '--users' and '--days' size of generated data
+         - '--workers', '--spawn-if-under', '--max-requests' paste
+           threadpool settings
+         - '--timeout' seconds after which a request counts as an error
+        """
+        stats = run_load_test(
+            requests=requests,
+            concurrency=concurrency,
+            mix=mix,
+            users=users,
+            days=days,
+            workers=workers,
+            spawn_if_under=spawn_if_under,
+            max_requests=max_requests,
+            timeout=timeout,
+        )
+        print 'Requests: %(requests)d (%(errors)d errors)' % stats
+        print 'Duration: %(duration).2f s' % stats
+        print 'Throughput: %(rps).1f requests/s' % stats
+        print 'Latency: p50 %(p50).1f ms, p95 %(p95).1f ms, ' \
+              'p99 %(p99).1f ms' % stats
+
     werkzeug.script.run()
@@ -4,15 +4,20 @@ Presence analyzer unit tests.
 """
 import os.path
 import json
+import socket
 import datetime
+import tempfile
 import unittest
 
-from presence_analyzer import main, utils
+from presence_analyzer import main, utils, loadtest
 
 
 TEST_DATA_CSV = os.path.join(
     os.path.dirname(__file__), '..', '..', 'runtime', 'data', 'test_data.csv'
 )
+SAMPLE_DATA_CSV = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'runtime', 'data', 'sample_data.csv'
+)
 
 
 # pylint: disable=maybe-no-member, too-many-public-methods
@@ -101,6 +106,162 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
             ]
         )
 
+    def test_start_histogram_view(self):
+        """
+        Test number of presence starts of given user grouped by hour.
+        """
+        resp = self.client.get('/api/v1/start_histogram/10')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 25)
+        self.assertListEqual(data[0], ['Hour', 'Starts'])
+        self.assertListEqual(data[10], ['09:00', 2])
+        self.assertListEqual(data[11], ['10:00', 1])
+
+        resp = self.client.get('/api/v1/start_histogram/0')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_presence_heatmap_view(self):
+        """
+        Test presence time of given user grouped by weekday and hour.
+        """
+        resp = self.client.get('/api/v1/presence_heatmap/10')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 8)
+        self.assertEqual(data[0][:3], ['Weekday', '00:00', '01:00'])
+        self.assertEqual(data[2][0], 'Tue')
+        self.assertEqual(data[2][1 + 9], 1255)
+        self.assertEqual(data[2][1 + 10], 3600)
+        self.assertEqual(data[2][1 + 17], 3592)
+        self.assertEqual(data[2][1 + 18], 0)
+
+        resp = self.client.get('/api/v1/presence_heatmap/0')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_presence_percentiles_view(self):
+        """
+        Test presence time percentiles of given user.
+        """
+        resp = self.client.get('/api/v1/presence_percentiles/11')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertListEqual(data[0], ['Weekday', 'p50 (s)', 'p90 (s)'])
+        self.assertListEqual(data[4], ['Thu', 22984.0, 22996.0])
+        self.assertListEqual(data[6], ['Sat', 0.0, 0.0])
+        self.assertIn('["Sat", 0.0, 0.0]', resp.data)
+
+        resp = self.client.get('/api/v1/presence_percentiles/0')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_occupancy_view(self):
+        """
+        Test office headcount over time.
+        """
+        resp = self.client.get('/api/v1/occupancy?start=2013-09-10')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 25)
+        self.assertListEqual(data[0], ['Time', 'Headcount'])
+        self.assertListEqual(data[1 + 9], ['2013-09-10 09:00', 2])
+        self.assertListEqual(data[1 + 14], ['2013-09-10 14:00', 1])
+        self.assertListEqual(data[1 + 18], ['2013-09-10 18:00', 0])
+
+        resp = self.client.get(
+            '/api/v1/occupancy?start=2013-09-09&end=2013-09-11&step=720'
+        )
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 7)
+        self.assertListEqual(data[1], ['2013-09-09 00:00', 1])
+        self.assertListEqual(data[6], ['2013-09-11 12:00', 2])
+
+        resp = self.client.get('/api/v1/occupancy')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(
+            '/api/v1/occupancy?start=2013-09-11&end=2013-09-10'
+        )
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get('/api/v1/occupancy?start=2013-09-10&step=0')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(
+            '/api/v1/occupancy?start=0001-01-01&end=9999-12-31&step=1440'
+        )
+        self.assertEqual(resp.status_code, 400)
+
+        resp = self.client.get(
+            '/api/v1/occupancy?start=2000-01-01&end=2000-12-31&step=1440'
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(json.loads(resp.data)), 367)
+
+    def test_health_live_view(self):
+        """
+        Test liveness check.
+        """
+        resp = self.client.get('/health/live')
+        self.assertEqual(resp.status_code, 200)
+        self.assertDictEqual(json.loads(resp.data), {u'status': u'ok'})
+
+    def test_health_ready_view(self):
+        """
+        Test readiness check.
+        """
+        utils.get_data()
+        resp = self.client.get('/health/ready')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data['status'], 'ok')
+        self.assertFalse(data['refreshing'])
+        self.assertEqual(data['version'], utils.get_data_version())
+        self.assertEqual(data['rows'], 9)
+        self.assertIn('load_duration', data)
+
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV + '.missing'})
+        resp = self.client.get('/health/ready')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(json.loads(resp.data)['status'], 'unavailable')
+
+    def test_health_ready_view_refresh(self):
+        """
+        Test previous data is served while data file is being reloaded.
+        """
+        with tempfile.NamedTemporaryFile(suffix='.csv') as csvfile:
+            csvfile.write(open(TEST_DATA_CSV).read())
+            csvfile.flush()
+            main.app.config.update({'DATA_CSV': csvfile.name})
+            utils.warm_up(1)
+            old_version = utils.get_data_version()
+
+            csvfile.write('\n12,2013-09-13,09:00:00,17:00:00\n')
+            csvfile.flush()
+            # pretend refresh is running, requests must not wait for it
+            with utils.REFRESH_LOCK:
+                resp = self.client.get('/api/v1/users')
+                self.assertEqual(len(json.loads(resp.data)), 2)
+                resp = self.client.get('/api/v1/mean_time_weekday/10')
+                self.assertEqual(resp.status_code, 200)
+                resp = self.client.get('/health/ready')
+                self.assertEqual(resp.status_code, 200)
+                data = json.loads(resp.data)
+                self.assertTrue(data['refreshing'])
+                self.assertEqual(data['version'], old_version)
+
+            resp = self.client.get('/health/ready')
+            self.assertEqual(resp.status_code, 200)
+            # wait for background refresh to finish
+            with utils.REFRESH_LOCK:
+                pass
+
+            resp = self.client.get('/api/v1/users')
+            self.assertEqual(len(json.loads(resp.data)), 3)
+            resp = self.client.get('/health/ready')
+            self.assertEqual(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertFalse(data['refreshing'])
+            self.assertEqual(data['version'], utils.get_data_version())
+            self.assertEqual(data['rows'], 10)
+
 
 class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
     """
@@ -134,6 +295,21 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
             datetime.time(9, 39, 5)
         )
 
+    def test_get_data_invalid_rows(self):
+        """
+        Test skipping and not counting rows which cannot be parsed.
+        """
+        with tempfile.NamedTemporaryFile(suffix='.csv') as csvfile:
+            csvfile.write(
+                '10,2013-09-10,09:39:05,17:59:52\n'
+                '10,2013-09-11,invalid,16:07:37\n'
+            )
+            csvfile.flush()
+            main.app.config.update({'DATA_CSV': csvfile.name})
+            data = utils.get_data()
+        self.assertItemsEqual(data[10].keys(), [datetime.date(2013, 9, 10)])
+        self.assertEqual(utils.DATA_STATUS['rows'], 1)
+
     def test_group_by_weekday(self):
         """
         Test grouping dates by weekdays.
@@ -178,6 +354,215 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
         self.assertEqual(utils.mean([]), 0)
         self.assertEqual(utils.mean([0]), 0)
 
+    def test_get_data_cache(self):
+        """
+        Test caching of parsed data until data file changes.
+        """
+        data = utils.get_data()
+        self.assertIs(utils.get_data(), data)
+        main.app.config.update({'DATA_CSV': SAMPLE_DATA_CSV})
+        self.assertIsNot(utils.get_data(), data)
+
+    def test_cache_locks(self):
+        """
+        Test computing cache entry while other entry is being computed.
+        """
+        utils.get_data()
+        stamp = utils.get_data_stamp()
+        with utils.cache_lock((stamp, 'get_statistics')):
+            self.assertIn(10, utils.get_data())
+            self.assertEqual(len(utils.get_user_weekdays(11)), 7)
+
+    def test_percentile(self):
+        """
+        Test calculating percentiles.
+        """
+        self.assertEqual(utils.percentile([], 50), 0)
+        self.assertIsInstance(utils.percentile([], 50), float)
+        self.assertEqual(utils.percentile([5], 90), 5)
+        self.assertIsInstance(utils.percentile([5], 90), float)
+        self.assertEqual(utils.percentile([3, 1, 2], 50), 2)
+        self.assertAlmostEqual(utils.percentile([0, 10], 90), 9)
+
+    def test_hourly_occupancy(self):
+        """
+        Test splitting presence into hourly bins.
+        """
+        bins = [0] * 24
+        utils.hourly_occupancy(bins, 9 * 3600 + 1800, 11 * 3600)
+        self.assertEqual(bins[8:12], [0, 1800, 3600, 0])
+
+    def test_get_statistics_invalid_intervals(self):
+        """
+        Test skipping intervals which end before they start.
+        """
+        with tempfile.NamedTemporaryFile(suffix='.csv') as csvfile:
+            csvfile.write(
+                '10,2013-09-10,09:30:00,09:10:00\n'
+                '10,2013-09-11,09:30:00,10:00:00\n'
+            )
+            csvfile.flush()
+            main.app.config.update({'DATA_CSV': csvfile.name})
+            stats = utils.get_statistics()
+        self.assertEqual(sum(stats[10]['start_histogram']), 1)
+        self.assertEqual(stats[10]['heatmap'][1][9], 0)
+        self.assertEqual(stats[10]['heatmap'][2][9], 1800)
+
+    def test_get_statistics(self):
+        """
+        Test computing presence distributions of all users.
+        """
+        stats = utils.get_statistics()
+        self.assertItemsEqual(stats.keys(), [10, 11])
+        self.assertEqual(sum(stats[11]['start_histogram']), 6)
+        self.assertEqual(len(stats[11]['heatmap']), 7)
+        self.assertEqual(stats[10]['percentiles'][1], (30047, 30047))
+
+    def test_get_occupancy(self):
+        """
+        Test calculating headcount in every minute of a day.
+        """
+        timeline = utils.get_occupancy(datetime.date(2013, 9, 10))
+        self.assertEqual(len(timeline), 24 * 60)
+        self.assertEqual(timeline[9 * 60 + 18], 0)
+        self.assertEqual(timeline[9 * 60 + 19], 1)
+        self.assertEqual(timeline[9 * 60 + 39], 2)
+        self.assertEqual(timeline[13 * 60 + 55], 2)
+        self.assertEqual(timeline[13 * 60 + 56], 1)
+        self.assertEqual(timeline[18 * 60], 0)
+        self.assertIs(
+            utils.get_occupancy(datetime.date(2000, 1, 1)),
+            utils.EMPTY_TIMELINE
+        )
+        self.assertEqual(utils.EMPTY_TIMELINE, (0,) * 24 * 60)
+
+    def test_timeline(self):
+        """
+        Test calculating headcount from intervals.
+        """
+        result = utils.timeline([(60, 180), (90, 150), (3600, 86399)])
+        self.assertEqual(result[:4], [0, 2, 2, 0])
+        self.assertEqual(result[59:61], [0, 1])
+        self.assertEqual(result[-1], 1)
+
+    def test_warm_up(self):
+        """
+        Test filling caches on startup.
+        """
+        utils.CACHE.clear()
+        utils.warm_up(1)
+        group_by_weekday = utils.group_by_weekday
+        utils.group_by_weekday = None
+        try:
+            self.assertEqual(len(utils.get_user_weekdays(11)), 7)
+            self.assertEqual(
+                utils.DATA_STATUS['version'], utils.get_data_version()
+            )
+            with self.assertRaises(TypeError):
+                utils.get_user_weekdays(10)
+        finally:
+            utils.group_by_weekday = group_by_weekday
+
+    def test_date_range(self):
+        """
+        Test iterating over dates.
+        """
+        start = datetime.date(2013, 9, 30)
+        self.assertListEqual(
+            list(utils.date_range(start, datetime.date(2013, 10, 1))),
+            [start, datetime.date(2013, 10, 1)]
+        )
+        self.assertListEqual(list(utils.date_range(start, start)), [start])
+
+
+class PresenceAnalyzerLoadTestTestCase(unittest.TestCase):
+    """
+    Load testing tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+    def test_generate_data(self):
+        """
+        Test generating presence data file.
+        """
+        with tempfile.NamedTemporaryFile(suffix='.csv') as csvfile:
+            loadtest.generate_data(csvfile.name, 3, 14)
+            main.app.config.update({'DATA_CSV': csvfile.name})
+            data = utils.get_data()
+        self.assertItemsEqual(data.keys(), [1, 2, 3])
+        self.assertEqual(len(data[1]), 10)
+
+    def test_parse_mix(self):
+        """
+        Test parsing weighted endpoints mix.
+        """
+        self.assertListEqual(
+            loadtest.parse_mix('users:1, presence_weekday:2'),
+            ['users', 'presence_weekday', 'presence_weekday']
+        )
+        self.assertListEqual(loadtest.parse_mix('users'), ['users'])
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('unknown:1')
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('users:x')
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('users:0,presence_weekday:0')
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('users:-1')
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('')
+
+    def test_run_load_test(self):
+        """
+        Test driving application with concurrent requests.
+        """
+        data_csv = main.app.config['DATA_CSV']
+        stats = loadtest.run_load_test(
+            requests=20, concurrency=2, users=2, days=7, workers=2,
+            spawn_if_under=1
+        )
+        self.assertEqual(stats['requests'], 20)
+        self.assertEqual(stats['errors'], 0)
+        self.assertGreater(stats['rps'], 0)
+        self.assertLessEqual(stats['p50'], stats['p99'])
+        self.assertEqual(main.app.config['DATA_CSV'], data_csv)
+
+        with self.assertRaises(TypeError):
+            loadtest.run_load_test(unknown=1)
+
+    def test_fetch(self):
+        """
+        Test recording failed requests.
+        """
+        latencies = []
+        errors = []
+        loadtest.fetch('http://127.0.0.1:1/', 1, latencies, errors)
+        self.assertListEqual(latencies, [])
+        self.assertListEqual(errors, ['http://127.0.0.1:1/'])
+
+        # server accepting connections but never responding
+        stalled = socket.socket()
+        stalled.bind(('127.0.0.1', 0))
+        stalled.listen(1)
+        url = 'http://127.0.0.1:{0}/'.format(stalled.getsockname()[1])
+        try:
+            loadtest.fetch(url, 0.1, latencies, errors)
+        finally:
+            stalled.close()
+        self.assertListEqual(latencies, [])
+        self.assertEqual(errors[-1], url)
+
 
 def suite():
     """
@@ -186,6 +571,7 @@ def suite():
     base_suite = unittest.TestSuite()
     base_suite.addTest(unittest.makeSuite(PresenceAnalyzerViewsTestCase))
     base_suite.addTest(unittest.makeSuite(PresenceAnalyzerUtilsTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerLoadTestTestCase))
     return base_suite
 
 
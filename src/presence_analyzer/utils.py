@@ -3,10 +3,14 @@
 Helper functions used in views.
 """
 
+import os
 import csv
+import time
+import hashlib
+import threading
 from json import dumps
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask import Response
 
@@ -15,6 +19,15 @@ from presence_analyzer.main import app
 import logging
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+CACHE = {}
+CACHE_LOCKS = {}
+CACHE_LOCKS_LOCK = threading.Lock()
+REFRESH_LOCK = threading.Lock()
+PINNED = threading.local()
+LOADED = {}
+LOAD_STATS = {}
+DATA_STATUS = {}
+
 
 def jsonify(function):
     """
@@ -32,6 +45,97 @@ def jsonify(function):
     return inner
 
 
+def get_data_stamp():
+    """
+    Returns path, modification time and size of data file.
+    """
+    path = app.config['DATA_CSV']
+    stat = os.stat(path)
+    return (path, stat.st_mtime, stat.st_size)
+
+
+def get_data_version(stamp=None):
+    """
+    Returns version of data file, it changes whenever the file is modified.
+    """
+    return hashlib.md5(
+        '{0}:{1}:{2}'.format(*(stamp or get_data_stamp()))
+    ).hexdigest()[:12]
+
+
+def get_served_stamp():
+    """
+    Returns stamp of data which should be served to requests.
+
+    Previously loaded data of the same file is served while its newer
+    version is loaded in background.
+    """
+    stamp = getattr(PINNED, 'stamp', None)
+    if stamp is not None:
+        return stamp
+
+    stamp = get_data_stamp()
+    loaded = LOADED.get('stamp')
+    if loaded is None or loaded[0] != stamp[0]:
+        return stamp
+    if loaded != stamp:
+        refresh(app.config.get('WARM_UP_USERS', 10))
+    return loaded
+
+
+def activate(stamp):
+    """
+    Starts serving data of given stamp and drops cache entries of other
+    versions.
+    """
+    LOADED['stamp'] = stamp
+    DATA_STATUS.update(LOAD_STATS.get(stamp, {}))
+    DATA_STATUS['version'] = get_data_version(stamp)
+    for key in list(CACHE):
+        if key[0] != stamp:
+            CACHE.pop(key, None)
+    for key in list(LOAD_STATS):
+        if key != stamp:
+            LOAD_STATS.pop(key, None)
+    with CACHE_LOCKS_LOCK:
+        for key in list(CACHE_LOCKS):
+            if key[0] != stamp:
+                del CACHE_LOCKS[key]
+
+
+def cache_lock(key):
+    """
+    Returns lock guarding computation of given cache entry.
+    """
+    with CACHE_LOCKS_LOCK:
+        return CACHE_LOCKS.setdefault(key, threading.Lock())
+
+
+def cache(function):
+    """
+    Caches wrapped function result for every version of data file.
+
+    Cached results are read without locking, missing ones are computed
+    by a single thread at a time for every cache entry.
+    """
+    @wraps(function)
+    def inner(*args):
+        """
+        This docstring will be overridden by @wraps decorator.
+        """
+        key = (get_served_stamp(), function.__name__) + args
+        result = CACHE.get(key)
+        if result is not None:
+            return result
+        with cache_lock(key):
+            result = CACHE.get(key)
+            if result is None:
+                result = CACHE[key] = function(*args)
+            return result
+    return inner
+
+
+@cache
 def get_data():
     """
     Extracts presence data from CSV file and groups it by user_id.
@@ -50,6 +154,9 @@ def get_data():
         }
     }
     """
+    started = time.time()
+    stamp = get_served_stamp()
+    rows = 0
     data = {}
     with open(app.config['DATA_CSV'], 'r') as csvfile:
         presence_reader = csv.reader(csvfile, delimiter=',')
@@ -65,12 +172,29 @@ def get_data():
                 end = datetime.strptime(row[3], '%H:%M:%S').time()
             except (ValueError, TypeError):
                 log.debug('Problem with line %d: ', i, exc_info=True)
+                continue
 
             data.setdefault(user_id, {})[date] = {'start': start, 'end': end}
+            rows += 1
 
+    LOAD_STATS[stamp] = {
+        'rows': rows,
+        'load_duration': time.time() - started,
+    }
+    loaded = LOADED.get('stamp')
+    if loaded is None or loaded[0] != stamp[0]:
+        activate(stamp)
     return data
 
 
+@cache
+def get_user_weekdays(user_id):
+    """
+    Groups presence entries of given user by weekday.
+    """
+    return group_by_weekday(get_data()[user_id])
+
+
 def group_by_weekday(items):
     """
     Groups presence entries by weekday.
@@ -102,3 +226,183 @@ def mean(items):
     Calculates arithmetic mean. Returns zero for empty lists.
     """
     return float(sum(items)) / len(items) if len(items) > 0 else 0
+
+
+def percentile(items, percent):
+    """
+    Calculates percentile using linear interpolation between closest ranks.
+    Always returns float, zero for empty lists.
+    """
+    if not items:
+        return 0.0
+    items = sorted(items)
+    rank = (len(items) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(items) - 1)
+    return float(items[lower] + (items[upper] - items[lower]) * (rank - lower))
+
+
+def hourly_occupancy(bins, start, end):
+    """
+    Adds seconds of presence between start and end to matching hourly bins.
+    """
+    for hour in range(start // 3600, (end - 1) // 3600 + 1):
+        bins[hour] += min(end, (hour + 1) * 3600) - max(start, hour * 3600)
+
+
+@cache
+def get_statistics():
+    """
+    Computes presence distributions of all users in a single pass over data.
+
+    It creates structure like this:
+    stats = {
+        'user_id': {
+            # number of presence starts in every hour of a day
+            'start_histogram': [0, 0, 0, 0, 0, 0, 0, 0, 2, 1, 0, ...],
+            # seconds of presence in every hour of a day, for every weekday
+            'heatmap': [[0, ..., 1255, 3600, 3600, ...], ...],
+            # 50th and 90th percentile of presence time for every weekday
+            'percentiles': [(30927.0, 31522.2), ...],
+        }
+    }
+    """
+    stats = {}
+    for user_id, items in get_data().items():
+        histogram = [0] * 24
+        heatmap = [[0] * 24 for _ in range(7)]
+        for date, presence in items.items():
+            start = seconds_since_midnight(presence['start'])
+            end = seconds_since_midnight(presence['end'])
+            if end <= start:
+                continue
+            histogram[start // 3600] += 1
+            hourly_occupancy(heatmap[date.weekday()], start, end)
+
+        stats[user_id] = {
+            'start_histogram': histogram,
+            'heatmap': heatmap,
+            'percentiles': [
+                (percentile(intervals, 50), percentile(intervals, 90))
+                for intervals in group_by_weekday(items)
+            ],
+        }
+    return stats
+
+
+@cache
+def get_intervals_by_date():
+    """
+    Groups presence intervals of all users by date.
+
+    It creates structure like this:
+    intervals = {
+        datetime.date(2013, 9, 10): [(34745, 64792), (33590, 50154)],
+    }
+    """
+    result = {}
+    for items in get_data().values():
+        for date, presence in items.items():
+            start = seconds_since_midnight(presence['start'])
+            end = seconds_since_midnight(presence['end'])
+            if end > start:
+                result.setdefault(date, []).append((start, end))
+    return result
+
+
+def timeline(intervals):
+    """
+    Calculates number of people present in every minute of a day.
+
+    Headcount is a running sum of a difference array built from start
+    and end minutes of all intervals.
+    """
+    changes = [0] * (24 * 60 + 1)
+    for start, end in intervals:
+        changes[start // 60] += 1
+        changes[(end + 59) // 60] -= 1
+
+    result = []
+    headcount = 0
+    for change in changes[:-1]:
+        headcount += change
+        result.append(headcount)
+    return result
+
+
+EMPTY_TIMELINE = tuple(timeline([]))
+
+
+@cache
+def get_occupancy_timelines():
+    """
+    Calculates headcount timelines of every day present in data.
+    """
+    return dict(
+        (date, tuple(timeline(intervals)))
+        for date, intervals in get_intervals_by_date().items()
+    )
+
+
+def get_occupancy(date):
+    """
+    Returns number of people present in every minute of given day.
+    """
+    return get_occupancy_timelines().get(date, EMPTY_TIMELINE)
+
+
+def date_range(start, end):
+    """
+    Yields dates from start to end inclusive.
+    """
+    for days in range((end - start).days + 1):
+        yield start + timedelta(days=days)
+
+
+def warm_up(top_users):
+    """
+    Loads current data and fills caches, including entries of most present
+    users, then starts serving it.
+    """
+    started = time.time()
+    stamp = PINNED.stamp = get_data_stamp()
+    try:
+        data = get_data()
+        get_statistics()
+        get_occupancy_timelines()
+        users = sorted(data, key=lambda i: len(data[i]), reverse=True)
+        for user_id in users[:top_users]:
+            get_user_weekdays(user_id)
+    finally:
+        del PINNED.stamp
+    activate(stamp)
+    log.info(
+        'Warmed up data version %s in %.2fs',
+        get_data_version(stamp), time.time() - started
+    )
+
+
+def refresh(top_users):
+    """
+    Warms up caches in background thread unless refresh is already running.
+
+    Returns True if refresh was started.
+    """
+    if not REFRESH_LOCK.acquire(False):
+        return False
+
+    def target():
+        """
+        Runs warm up and releases refresh lock.
+        """
+        try:
+            warm_up(top_users)
+        except (IOError, OSError):
+            log.exception('Refreshing data failed!')
+        finally:
+            REFRESH_LOCK.release()
+
+    thread = threading.Thread(target=target, name='refresh')
+    thread.daemon = True
+    thread.start()
+    return True
@@ -4,14 +4,23 @@ Defines views.
 """
 
 import calendar
-from flask import redirect, abort
+from json import dumps
+from datetime import datetime
+
+from flask import redirect, abort, request, Response
 
 from presence_analyzer.main import app
-from presence_analyzer.utils import jsonify, get_data, mean, group_by_weekday
+from presence_analyzer.utils import (
+    jsonify, get_data, get_data_version, get_statistics,
+    get_occupancy_timelines, get_user_weekdays, mean, date_range, refresh,
+    DATA_STATUS, EMPTY_TIMELINE, LOADED
+)
 
 import logging
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+MAX_OCCUPANCY_DAYS = 366
+
 
 @app.route('/')
 def mainpage():
@@ -45,7 +54,7 @@ def mean_time_weekday_view(user_id):
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    weekdays = group_by_weekday(data[user_id])
+    weekdays = get_user_weekdays(user_id)
     result = [
         (calendar.day_abbr[weekday], mean(intervals))
         for weekday, intervals in enumerate(weekdays)
@@ -65,7 +74,7 @@ def presence_weekday_view(user_id):
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    weekdays = group_by_weekday(data[user_id])
+    weekdays = get_user_weekdays(user_id)
     result = [
         (calendar.day_abbr[weekday], sum(intervals))
         for weekday, intervals in enumerate(weekdays)
@@ -73,3 +82,145 @@ def presence_weekday_view(user_id):
 
     result.insert(0, ('Weekday', 'Presence (s)'))
     return result
+
+
+@app.route('/api/v1/start_histogram/<int:user_id>', methods=['GET'])
+@jsonify
+def start_histogram_view(user_id):
+    """
+    Returns number of presence starts of given user grouped by hour.
+    """
+    stats = get_statistics()
+    if user_id not in stats:
+        log.debug('User %s not found!', user_id)
+        abort(404)
+
+    result = [
+        ('{0:02d}:00'.format(hour), count)
+        for hour, count in enumerate(stats[user_id]['start_histogram'])
+    ]
+
+    result.insert(0, ('Hour', 'Starts'))
+    return result
+
+
+@app.route('/api/v1/presence_heatmap/<int:user_id>', methods=['GET'])
+@jsonify
+def presence_heatmap_view(user_id):
+    """
+    Returns presence time of given user grouped by weekday and hour.
+    """
+    stats = get_statistics()
+    if user_id not in stats:
+        log.debug('User %s not found!', user_id)
+        abort(404)
+
+    result = [
+        [calendar.day_abbr[weekday]] + bins
+        for weekday, bins in enumerate(stats[user_id]['heatmap'])
+    ]
+
+    hours = ['{0:02d}:00'.format(hour) for hour in range(24)]
+    result.insert(0, ['Weekday'] + hours)
+    return result
+
+
+@app.route('/api/v1/presence_percentiles/<int:user_id>', methods=['GET'])
+@jsonify
+def presence_percentiles_view(user_id):
+    """
+    Returns median and 90th percentile of presence time of given user
+    grouped by weekday.
+    """
+    stats = get_statistics()
+    if user_id not in stats:
+        log.debug('User %s not found!', user_id)
+        abort(404)
+
+    result = [
+        (calendar.day_abbr[weekday], p50, p90)
+        for weekday, (p50, p90) in enumerate(stats[user_id]['percentiles'])
+    ]
+
+    result.insert(0, ('Weekday', 'p50 (s)', 'p90 (s)'))
+    return result
+
+
+@app.route('/api/v1/occupancy', methods=['GET'])
+@jsonify
+def occupancy_view():
+    """
+    Returns office headcount over time between 'start' and 'end' dates.
+
+    Headcount is the maximum number of people present within every 'step'
+    minutes long period. Range is limited to MAX_OCCUPANCY_DAYS days.
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(
+            request.args.get('end', request.args['start']), '%Y-%m-%d'
+        ).date()
+        step = int(request.args.get('step', 60))
+    except (KeyError, ValueError):
+        log.debug('Invalid occupancy query: %s', request.args, exc_info=True)
+        abort(400)
+    if (end < start or (end - start).days >= MAX_OCCUPANCY_DAYS or
+            not 0 < step <= 24 * 60):
+        log.debug('Invalid occupancy query: %s', request.args)
+        abort(400)
+
+    timelines = get_occupancy_timelines()
+    result = [('Time', 'Headcount')]
+    for date in date_range(start, end):
+        timeline = timelines.get(date, EMPTY_TIMELINE)
+        for minute in range(0, 24 * 60, step):
+            result.append((
+                '{0} {1:02d}:{2:02d}'.format(date, minute // 60, minute % 60),
+                max(timeline[minute:minute + step]),
+            ))
+    return result
+
+
+@app.route('/health/live', methods=['GET'])
+@jsonify
+def health_live_view():
+    """
+    Reports that application process is up.
+    """
+    return {'status': 'ok'}
+
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready_view():
+    """
+    Reports whether data is loaded and application can serve traffic.
+
+    Stale or missing data is reloaded in background, previously loaded
+    data of the same file is served until the reload finishes.
+    """
+    try:
+        version = get_data_version()
+    except OSError:
+        log.debug('Data file not available!', exc_info=True)
+        version = None
+
+    refreshing = False
+    if version is not None and DATA_STATUS.get('version') != version:
+        refresh(app.config.get('WARM_UP_USERS', 10))
+        refreshing = True
+
+    loaded = LOADED.get('stamp')
+    ready = (
+        version is not None and loaded is not None and
+        loaded[0] == app.config['DATA_CSV']
+    )
+    result = dict(
+        DATA_STATUS,
+        status='ok' if ready else 'unavailable',
+        refreshing=refreshing,
+    )
+    return Response(
+        dumps(result),
+        status=200 if ready else 503,
+        mimetype='application/json'
+    )